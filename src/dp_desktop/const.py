@@ -1,2 +1,3 @@
 class Params(object):
-    allowed_suffix = {'.pdf', '.jpg', '.jpeg', '.png', '.txt', '.tiff', '.tif','.webp'}
\ No newline at end of file
+    # Lowercase, with the dot; frozen so it is hashed once and can't be mutated by accident
+    allowed_suffix = frozenset({'.pdf', '.jpg', '.jpeg', '.png', '.txt', '.tiff', '.tif', '.webp'})
\ No newline at end of file
@@ -1,17 +1,31 @@
 import concurrent.futures
 import dataclasses
-import json
 import logging
-import threading
+import shutil
+import time
 from pathlib import Path
-from typing import Optional, Callable
+from typing import List, Optional, Callable, Tuple
+
+import orjson
+import requests
+import urllib3
 
 # Import the retry logic from utils.py
-from dp_desktop.utils import request_with_retries
+from dp_desktop.utils import default_max_workers, request_with_retries, warm_dns
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # Bytes read from the socket per write when streaming PDFs
+LIST_PREFETCH_PAGES = 8  # Document-list pages requested in parallel once the dataset spans several
+MANIFEST_FILENAME = '.docupipe_manifest.json'  # Cached document list, written to the output folder
+MANIFEST_MAX_AGE = 3600  # Seconds a cached document list is reused before listing again
+PDF_BODY_ATTEMPTS = 4  # Tries at streaming a PDF body before the document fails
+PDF_BODY_RETRY_DELAY = 2  # Seconds before the first retry of a broken PDF transfer, doubling after each
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Document:
+    # Declared by hand (dataclass(slots=True) needs Python 3.10) to drop the per-instance __dict__
+    __slots__ = ('documentId', 'filename', 'fileExtension')
+
     documentId: str
     filename: str
     fileExtension: str
@@ -22,20 +36,30 @@ def download_dataset(
         dataset_name: str,
         output_dir: Path,
         progress_callback: Optional[Callable[[int, int], None]] = None,
-        error_callback: Optional[Callable[[str, str], None]] = None
+        error_callback: Optional[Callable[[str, str], None]] = None,
+        max_workers: Optional[int] = None
 ):
     """
     Download a dataset with progress/error callbacks.
 
-    - Uses list_documents() to retrieve the list of documents.
+    - Uses list_documents() to retrieve the list of documents, or the manifest a
+      previous run cached in output_dir if it is less than an hour old.
+    - Files already in output_dir are not downloaded again: a document whose PDF
+      exists only has its standardization JSON fetched, and one with both is skipped.
     - For each document, downloads its OCR URL, then its PDF, and
       finally any available standardization JSON data.
     - Progress and errors are reported via the provided callbacks.
+    - max_workers defaults to default_max_workers() (8 per CPU, capped).
     """
     logging.info(f"Starting download of dataset='{dataset_name}' to: {output_dir}")
+    warm_dns()
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    all_documents = list_documents(api_key, dataset_name)
+    all_documents = _load_manifest(output_dir, dataset_name)
+    if all_documents is None:
+        all_documents, complete = _list_documents(api_key, dataset_name)
+        if complete:
+            _save_manifest(output_dir, dataset_name, all_documents)
     total_docs = len(all_documents)
     logging.info(f"Total docs to download: {total_docs}")
 
@@ -43,74 +67,178 @@ def download_dataset(
         logging.info("No documents found for this dataset. Returning.")
         return
 
-    progress_lock = threading.Lock()
-    docs_completed = [0]  # mutable reference for closure
+    # Skip documents whose PDF and standardization JSON a previous run already downloaded.
+    # Documents with only the PDF still get their standardization fetched (it may not exist
+    # yet, or the previous run may have failed on it); download_single skips the PDF itself.
+    pending_documents = [
+        doc for doc in all_documents
+        if not (_is_nonempty_file(output_dir / (doc.filename + '.pdf'))
+                and _is_nonempty_file(output_dir / f"{doc.filename}.json"))
+    ]
+    docs_skipped = total_docs - len(pending_documents)
+    if docs_skipped:
+        logging.info(f"Skipping {docs_skipped} documents already downloaded to: {output_dir}")
 
     # Call initial progress callback
     if progress_callback:
-        progress_callback(0, total_docs)
+        progress_callback(docs_skipped, total_docs)
+
+    # Built once and shared by every download; never sent to the presigned PDF URL.
+    headers = {
+        "accept": "application/json",
+        "X-API-Key": api_key
+    }
 
     def download_single(doc: Document):
         """Download the PDF and standardization data for a single document."""
         doc_label = f"{doc.filename} ({doc.documentId})"
         logging.info(f"Starting download for: {doc_label}")
+        output_path = output_dir / (doc.filename + '.pdf')
+        json_path = output_dir / f"{doc.filename}.json"
 
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": api_key
-        }
         try:
-            # 1) Obtain a short-lived OCR download URL using retry logic.
-            url = f"https://app.docupipe.ai/document/{doc.documentId}/download/ocr-url?hours=6"
-            response = request_with_retries("GET", url, headers=headers)
-            result = response.json()
-            download_url = result.get('url')
-            if not download_url:
-                raise RuntimeError("No download URL found in response.")
-
-            # 2) Download the PDF file using the retry logic.
-            file_response = request_with_retries("GET", download_url)
-            output_path = output_dir / (doc.filename + '.pdf')
-            with open(output_path, 'wb') as f:
-                f.write(file_response.content)
-            logging.info(f"Downloaded PDF for: {doc_label}")
-
-            # 3) Download standardization data (if present) using the retry logic.
+            if _is_nonempty_file(output_path):
+                logging.info(f"PDF already downloaded for: {doc_label}")
+            else:
+                # 1) Obtain a short-lived OCR download URL using retry logic.
+                url = f"https://app.docupipe.ai/document/{doc.documentId}/download/ocr-url?hours=6"
+                response = request_with_retries("GET", url, headers=headers)
+                result = orjson.loads(response.content)
+                download_url = result.get('url')
+                if not download_url:
+                    raise RuntimeError("No download URL found in response.")
+
+                # 2) Stream the PDF file to disk, retrying broken transfers.
+                _stream_to_file(download_url, output_path, doc_label)
+                logging.info(f"Downloaded PDF for: {doc_label}")
+
+            # 3) Download standardization data (if present and not already on disk) using the retry logic.
+            if _is_nonempty_file(json_path):
+                logging.info(f"Finished download for: {doc_label} (standardization JSON already downloaded)")
+                return
+
             stds_url = (
                 f"https://app.docupipe.ai/standardizations"
                 f"?document_id={doc.documentId}&limit=20&offset=0&exclude_payload=false"
             )
             stds_resp = request_with_retries("GET", stds_url, headers=headers)
-            stds = stds_resp.json()
+            stds = orjson.loads(stds_resp.content)
             if stds:
                 std = stds[0]
                 standardization_dict = std.get('data')
                 if standardization_dict:
-                    json_path = output_dir / f"{doc.filename}.json"
-                    with open(json_path, 'w') as f:
-                        json.dump(standardization_dict, f, indent=2)
+                    json_path.write_bytes(orjson.dumps(standardization_dict, option=orjson.OPT_INDENT_2))
                     logging.info(f"Downloaded standardization JSON for: {doc_label}")
 
             logging.info(f"Finished download for: {doc_label}")
 
         except Exception as e:
             logging.error(f"Error downloading document {doc_label}: {e}", exc_info=True)
-            if error_callback:
-                error_callback(doc_label, str(e))
+            raise
 
-        finally:
-            # Update progress after each document completes (successfully or not)
-            with progress_lock:
-                docs_completed[0] += 1
-                if progress_callback:
-                    progress_callback(docs_completed[0], total_docs)
-
-    max_workers = 20
+    if max_workers is None:
+        max_workers = default_max_workers()
     logging.info(f"Creating ThreadPoolExecutor with max_workers={max_workers}")
+    docs_completed = docs_skipped
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        executor.map(download_single, all_documents)
+        future_to_doc = {executor.submit(download_single, doc): doc for doc in pending_documents}
+
+        # Report from this thread, in completion order, so callbacks never race
+        for future in concurrent.futures.as_completed(future_to_doc):
+            doc = future_to_doc[future]
+            try:
+                future.result()  # Raises if the download failed (already logged)
+            except Exception as e:
+                if error_callback:
+                    error_callback(f"{doc.filename} ({doc.documentId})", str(e))
+
+            # Update progress after each document completes (successfully or not)
+            docs_completed += 1
+            if progress_callback:
+                progress_callback(docs_completed, total_docs)
+
+    logging.info(f"All downloads completed. Documents processed: {docs_completed} / {total_docs}")
+
+
+def _stream_to_file(url: str, output_path: Path, label: str):
+    """
+    Stream url to output_path. Chunks go to a .part file that is renamed into place
+    once complete, so an interrupted download never leaves a truncated file behind.
+
+    request_with_retries only covers getting the response headers; with stream=True
+    the body is read afterwards, so a connection reset or read timeout mid-transfer
+    is retried here (from the start, with the same URL) up to PDF_BODY_ATTEMPTS times.
+    Error statuses are not retried.
+    """
+    partial_path = output_path.with_name(output_path.name + '.part')
+    for attempt in range(1, PDF_BODY_ATTEMPTS + 1):
+        try:
+            file_response = request_with_retries("GET", url, stream=True)
+            try:
+                # Copy in C with large reads; decode_content undoes any gzip/deflate encoding
+                file_response.raw.decode_content = True
+                with open(partial_path, 'wb') as f:
+                    shutil.copyfileobj(file_response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
+            finally:
+                file_response.close()
+            partial_path.replace(output_path)
+            return
+        except requests.HTTPError:
+            raise
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            if attempt == PDF_BODY_ATTEMPTS:
+                raise
+            logging.warning(f"PDF transfer for {label} failed (attempt {attempt}): {e}. Will retry...")
+            time.sleep(PDF_BODY_RETRY_DELAY * 2 ** (attempt - 1))
+        finally:
+            partial_path.unlink(missing_ok=True)
 
-    logging.info(f"All downloads completed. Documents processed: {docs_completed[0]} / {total_docs}")
+
+def _is_nonempty_file(path: Path) -> bool:
+    try:
+        return path.stat().st_size > 0
+    except OSError:
+        return False
+
+
+def _load_manifest(output_dir: Path, dataset_name: str) -> Optional[List[Document]]:
+    """
+    Return the document list cached in output_dir by a previous run, or None if it is
+    missing, unreadable, for another dataset or older than MANIFEST_MAX_AGE seconds.
+    """
+    manifest_path = output_dir / MANIFEST_FILENAME
+    try:
+        manifest = orjson.loads(manifest_path.read_bytes())
+        if manifest['dataset_name'] != dataset_name:
+            return None
+        age = time.time() - manifest['fetched_at']
+        if not 0 <= age < MANIFEST_MAX_AGE:
+            return None
+        documents = [Document(**doc) for doc in manifest['documents']]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return None
+
+    logging.info(f"Using cached document list from {manifest_path} ({len(documents)} docs, {age:.0f}s old)")
+    return documents
+
+
+def _save_manifest(output_dir: Path, dataset_name: str, documents: List[Document]):
+    """Cache the document list in output_dir so a resumed run can skip listing."""
+    manifest_path = output_dir / MANIFEST_FILENAME
+    manifest = {
+        "fetched_at": time.time(),
+        "dataset_name": dataset_name,
+        "documents": [dataclasses.asdict(doc) for doc in documents],
+    }
+    try:
+        tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+        tmp_path.write_bytes(orjson.dumps(manifest))
+        tmp_path.replace(manifest_path)
+    except OSError as e:
+        logging.warning(f"Could not write manifest {manifest_path}: {e}")
 
 
 def list_documents(api_key: str, dataset_name: str):
@@ -118,15 +246,32 @@ def list_documents(api_key: str, dataset_name: str):
     List all documents for the specified dataset from DocuPipe (paginated).
     Returns a list of Document objects.
     """
+    all_documents, _ = _list_documents(api_key, dataset_name)
+    return all_documents
+
+
+def _list_documents(api_key: str, dataset_name: str) -> Tuple[List[Document], bool]:
+    """
+    Implementation of list_documents() that also reports whether the listing
+    completed (False if a page failed and the list may be partial).
+
+    The first page is fetched alone. If it comes back full, the following pages
+    are requested LIST_PREFETCH_PAGES at a time in parallel until a short page
+    marks the end of the dataset.
+    """
     logging.info(f"Listing all documents for dataset='{dataset_name}'")
     limit = 20000
-    offset = 0
     all_documents = []
+    seen_ids = set()
 
     max_iterations = 500
 
-    for iter_i in range(max_iterations):
-        logging.info(f"Iteration {iter_i + 1} to fetch documents...")
+    headers = {
+        "accept": "application/json",
+        "X-API-Key": api_key
+    }
+
+    def fetch_page(offset: int):
         url = (
             "https://app.docupipe.ai/documents"
             f"?dataset={dataset_name}"
@@ -134,33 +279,45 @@ def list_documents(api_key: str, dataset_name: str):
             f"&offset={offset}"
             "&exclude_payload=true"
         )
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": api_key
-        }
+        response = request_with_retries("GET", url, headers=headers)
+        return orjson.loads(response.content)
 
-        try:
-            response = request_with_retries("GET", url, headers=headers)
-            new_documents = response.json()
-            if not new_documents:
+    pages_fetched = 0
+    complete = True
+    offsets = [0]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=LIST_PREFETCH_PAGES) as executor:
+        while offsets:
+            logging.info(f"Fetching {len(offsets)} page(s) of documents, iterations "
+                         f"{pages_fetched + 1}-{pages_fetched + len(offsets)}...")
+            try:
+                pages = list(executor.map(fetch_page, offsets))
+                pages_fetched += len(offsets)
+
+                for new_documents in pages:
+                    for doc in new_documents:
+                        # Pages fetched in parallel may overlap if the dataset changes meanwhile
+                        if doc['documentId'] in seen_ids:
+                            continue
+                        seen_ids.add(doc['documentId'])
+                        all_documents.append(
+                            Document(
+                                documentId=doc['documentId'],
+                                filename=doc['filename'],
+                                fileExtension=doc['fileExtension']
+                            )
+                        )
+
+            except Exception as e:
+                logging.error(f"Error fetching documents for dataset='{dataset_name}': {e}", exc_info=True)
+                complete = False
                 break
 
-            for doc in new_documents:
-                all_documents.append(
-                    Document(
-                        documentId=doc['documentId'],
-                        filename=doc['filename'],
-                        fileExtension=doc['fileExtension']
-                    )
-                )
-            offset += limit
-
-            if len(new_documents) < limit:
+            if any(len(page) < limit for page in pages) or pages_fetched >= max_iterations:
                 break
 
-        except Exception as e:
-            logging.error(f"Error fetching documents for dataset='{dataset_name}': {e}", exc_info=True)
-            break
+            next_offset = offsets[-1] + limit
+            batch_size = min(LIST_PREFETCH_PAGES, max_iterations - pages_fetched)
+            offsets = [next_offset + i * limit for i in range(batch_size)]
 
     logging.info(f"Total documents fetched: {len(all_documents)}")
-    return all_documents
+    return all_documents, complete
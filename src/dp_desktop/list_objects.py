@@ -1,11 +1,18 @@
 import dataclasses
 from typing import List
 
-import requests
+import orjson
 
+from dp_desktop.utils import get_session
 
-@dataclasses.dataclass
+REQUEST_TIMEOUT = 30  # Seconds a listing request can wait before timing out
+
+
+@dataclasses.dataclass(frozen=True)
 class Schema:
+    # Explicit slots rather than slots=True, which is 3.10+
+    __slots__ = ('schemaName', 'schemaId')
+
     schemaName: str
     schemaId: str
 
@@ -17,11 +24,11 @@ def list_schemas(api_key: str) -> List[Schema]:
         "accept": "application/json",
         "X-API-Key": api_key
     }
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
 
     if response.status_code != 200:
         raise Exception(f"Error: {response.status_code} - {response.text}")
-    schemas = response.json()
+    schemas = orjson.loads(response.content)
     return [Schema(schemaName=schema['schemaName'], schemaId=schema['schemaId']) for schema in schemas]
 
 
@@ -32,9 +39,9 @@ def list_dataset_names(api_key: str) -> List[str]:
         "accept": "application/json",
         "X-API-Key": api_key
     }
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
 
     if response.status_code != 200:
         raise Exception(f"Error: {response.status_code} - {response.text}")
-    datasets = response.json()['datasetNames']
+    datasets = orjson.loads(response.content)['datasetNames']
     return datasets
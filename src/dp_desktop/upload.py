@@ -1,17 +1,150 @@
-import base64
+import binascii
+import io
 import logging
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, List, Optional, Tuple
 
-from dp_desktop.utils import request_with_retries
+import orjson
+
+from dp_desktop.const import Params
+from dp_desktop.utils import count_files, default_max_workers, iter_allowed_files, request_with_retries, warm_dns
 
 # Constants for timeouts
 POST_REQUEST_TIMEOUT = 100  # Seconds each POST/GET can wait before timing out
 REQUEST_TIMEOUT = 10  # Seconds each POST/GET can wait before timing out
 POLL_TIMEOUT = 900  # Total seconds to wait for a doc to finish uploading/processing
-POLL_INTERVAL = 5  # Seconds between status checks
+POLL_INITIAL_DELAY = 0.5  # Seconds before the first status check
+POLL_MAX_DELAY = 10.0  # Cap on the (exponentially growing) pause between status checks
+POLL_BACKOFF = 1.5  # Growth factor of the pause after each status check
+UPLOAD_READ_CHUNK = 3 * (1 << 16)  # Bytes read per step; a multiple of 3 so chunks base64-encode without padding
+UPLOAD_QUEUE_FACTOR = 2  # Uploads queued per upload worker while walking the folder
+# Threads per pipeline stage after the upload (which uses max_workers). The poll
+# stages spend nearly all their time asleep, so they can run much wider.
+# utils.POOL_MAXSIZE is sized from these; update it if they change.
+DOC_POLL_WORKERS = 100
+STANDARDIZE_WORKERS = 4
+STD_POLL_WORKERS = 100
+STANDARDIZE_BATCH_SIZE = 50  # Max docs per /v2/standardize/batch request
+STANDARDIZE_BATCH_LINGER = 2  # Seconds a partial batch waits for more docs before being sent
+
+# Pipeline stages of a single file in upload_files
+_STAGE_UPLOAD = "upload"
+_STAGE_DOC_POLL = "doc_poll"
+_STAGE_STANDARDIZE = "standardize"
+_STAGE_STD_POLL = "std_poll"
+
+
+def _poll_until(
+        url: str,
+        headers: dict,
+        is_done: Callable[..., bool],
+        description: str,
+        log: logging.Logger,
+        budget: float = POLL_TIMEOUT,
+        statuses_to_return: Optional[set] = None
+):
+    """
+    GET `url` until is_done(response) returns True, pausing between checks with
+    exponential backoff (POLL_INITIAL_DELAY, growing by POLL_BACKOFF up to
+    POLL_MAX_DELAY). Fast documents are noticed within a second or two, while
+    slow ones cost far fewer requests than fixed-interval polling.
+    Raises RuntimeError if `budget` seconds pass first. statuses_to_return is
+    passed to request_with_retries so is_done can see e.g. a "not yet" 404.
+    """
+    start_time = time.time()
+    delay = POLL_INITIAL_DELAY
+
+    while True:
+        if (time.time() - start_time) > budget:
+            raise RuntimeError(f"Timeout after {budget}s: {description} never completed.")
+
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+
+        # Use our retry wrapper for GET
+        response = request_with_retries(
+            "GET",
+            url,
+            headers=headers,
+            request_timeout=REQUEST_TIMEOUT,
+            statuses_to_return=statuses_to_return,
+            log=log
+        )
+        if is_done(response):
+            return response
+
+
+class _Base64JsonBody:
+    """
+    File-like JSON body for the upload endpoint.
+
+    The document's bytes are read and base64-encoded chunk by chunk as the body is
+    sent, so neither the raw file nor its encoding is ever held in memory whole.
+    Content-Length is known up front via __len__, and seek(0) rewinds the body so
+    request_with_retries can resend it.
+    """
+
+    def __init__(self, file_path: Path, dataset_name: str):
+        self._file_path = file_path
+        self._prefix = (
+            b'{"dataset": ' + orjson.dumps(dataset_name)
+            + b', "document": {"file": {"filename": ' + orjson.dumps(file_path.name)
+            + b', "contents": "'
+        )
+        self._suffix = b'"}}}'
+        encoded_size = 4 * -(-file_path.stat().st_size // 3)
+        self._length = len(self._prefix) + encoded_size + len(self._suffix)
+        # Raw bytes are read into one reused buffer rather than a new bytes object per chunk
+        self._read_buffer = bytearray(UPLOAD_READ_CHUNK)
+        self._read_view = memoryview(self._read_buffer)
+        self._file = None
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Upload body can only be rewound to the start.")
+        self.close()
+        self._file = open(self._file_path, 'rb')
+        self._buffer = self._prefix
+        self._pos = 0
+        return 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(UPLOAD_READ_CHUNK), b''))
+
+        parts = []
+        while size > 0:
+            if self._pos >= len(self._buffer) and not self._refill():
+                break
+            piece = self._buffer[self._pos:self._pos + size]
+            self._pos += len(piece)
+            size -= len(piece)
+            parts.append(piece)
+        return b''.join(parts)
+
+    def _refill(self) -> bool:
+        """Load the next encoded chunk (or the closing suffix) into the buffer; False once exhausted."""
+        if self._file is None:
+            return False
+        n = self._file.readinto(self._read_buffer)
+        if n:
+            self._buffer = binascii.b2a_base64(self._read_view[:n], newline=False)
+        else:
+            self._buffer = self._suffix
+            self.close()
+        self._pos = 0
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
 
 def upload_files(
@@ -21,87 +154,81 @@ def upload_files(
         schema_id: Optional[str] = None,
         progress_callback: Optional[Callable[[int, int], None]] = None,
         error_callback: Optional[Callable[[Path, str], None]] = None,
-        max_workers: int = 20
+        max_workers: Optional[int] = None
 ):
     """
     Production-grade uploader for large-scale doc ingestion and (optional) standardization.
 
     Features:
-    - Parallel uploads with ThreadPoolExecutor.
+    - Files with an allowed extension are discovered lazily in folder_path itself;
+      subfolders are not uploaded (filenames are sent without their folder, so
+      files with the same name in different subfolders would collide).
+    - Each pipeline stage (upload, doc poll, standardize, standardization poll) has its own
+      ThreadPoolExecutor, sized to how much of its time it spends waiting.
+    - max_workers defaults to default_max_workers() (8 per CPU, capped).
     - Each HTTP request has a hard 10-second timeout to prevent indefinite waiting.
-    - Polling each doc's status is capped at 900 seconds total.
-    - Standardization (if schema_id is provided) also has a 900-second cap.
+    - Polling each doc's status backs off exponentially and is capped at 900 seconds total.
+    - Standardization (if schema_id is provided) is requested in batches and also has a 900-second cap.
     - Detailed logging at each step; every failure is logged at ERROR level.
     - progress_callback(files_completed, total_files) is called after each successful file.
     - error_callback(file_path, error_message) is called on each failure if provided.
     """
 
-    # For demonstration only – replace with your actual file-discovery logic
-    def get_files(path: Path):
-        all_files = list(path.glob("*"))
-        # Example: we’ll just filter by extension here
-        allowed_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.txt', '.tiff', '.tif', '.webp'}
-        allowed_files = [f for f in all_files if f.suffix.lower() in allowed_extensions]
-        return all_files, allowed_files
-
     log = logging.getLogger(__name__)
 
-    # 1) Discover valid files
-    log.info(f"Scanning folder: {folder_path}")
+    # Resolve the API host while we walk the folder
+    warm_dns()
 
-    allowed_set = {'.pdf', '.jpg', '.jpeg', '.png', '.txt', '.tiff', '.tif', '.webp'}
+    # 1) Count valid files with a cheap first pass; the upload loop below walks the
+    #    folder again lazily, so the file list is never held in memory.
+    log.info(f"Scanning folder: {folder_path}")
 
-    all_files, allowed_files = get_files(folder_path)
-    total_files = len(allowed_files)
+    total_all_files, total_files = count_files(folder_path, recursive=False)
 
-    log.info(f"Found {len(all_files)} total files; {len(allowed_files)} valid files "
-             f"(allowed extensions: {allowed_set}).")
+    log.info(f"Found {total_all_files} total files; {total_files} valid files "
+             f"(allowed extensions: {', '.join(sorted(Params.allowed_suffix))}).")
 
-    if len(allowed_files) == 0:
+    if total_files == 0:
         log.info("No valid files to process; returning early.")
         return
 
+    if max_workers is None:
+        max_workers = default_max_workers()
+
     # Let the user/UI know we're at 0 of total_files
     if progress_callback:
         progress_callback(0, total_files)
 
-    # 2) Internal function for single-file upload + poll + (optional) standardize
-    def _upload_and_standardize_file(file_path: Path):
-        """Upload a single file, poll for completion, optionally standardize, with robust timeouts."""
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "X-API-Key": api_key
-        }
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "X-API-Key": api_key
+    }
 
+    # 2) Internal functions for the stages of a single file: upload (bandwidth-bound),
+    #    then poll, (optional) batched standardize and poll again (mostly sleeping).
+    def _upload_file(file_path: Path) -> str:
+        """Upload a single file and return its documentId."""
         # --- (A) Upload step ---
         try:
             log.info(f"[UPLOAD START] {file_path.name}")
 
-            with open(file_path, 'rb') as f:
-                file_contents = base64.b64encode(f.read()).decode()
-
             upload_url = "https://app.docupipe.ai/document"
-            payload = {
-                "dataset": dataset_name,
-                "document": {
-                    "file": {
-                        "contents": file_contents,
-                        "filename": file_path.name
-                    }
-                }
-            }
+            body = _Base64JsonBody(file_path, dataset_name)
 
             # Use our retry wrapper for POST
-            response = request_with_retries(
-                "POST",
-                upload_url,
-                json=payload,
-                headers=headers,
-                request_timeout=POST_REQUEST_TIMEOUT,
-                log=log
-            )
-            document_id = response.json().get('documentId')
+            try:
+                response = request_with_retries(
+                    "POST",
+                    upload_url,
+                    data=body,
+                    headers=headers,
+                    request_timeout=POST_REQUEST_TIMEOUT,
+                    log=log
+                )
+            finally:
+                body.close()
+            document_id = orjson.loads(response.content).get('documentId')
             if not document_id:
                 raise RuntimeError(f"No documentId returned for {file_path.name}")
 
@@ -112,120 +239,187 @@ def upload_files(
             log.error(msg, exc_info=True)
             raise RuntimeError(msg) from e
 
+        return document_id
+
+    def _wait_for_document(file_path: Path, document_id: str) -> str:
+        """Poll an uploaded doc until processing completes; returns its documentId."""
         # --- (B) Poll for doc to reach "completed" within 900 seconds ---
         try:
-            doc_get_url = f"https://app.docupipe.ai/document/{document_id}"
-            start_time = time.time()
+            def _doc_is_done(get_resp) -> bool:
+                status = orjson.loads(get_resp.content).get('status')
+                if status == 'failed':
+                    raise RuntimeError(f"Doc {document_id} failed during processing.")
+                return status == 'completed'
+
+            _poll_until(
+                f"https://app.docupipe.ai/document/{document_id}",
+                headers,
+                _doc_is_done,
+                description=f"doc {document_id}",
+                log=log
+            )
+            log.info(f"[DOC COMPLETED] {file_path.name}, docId={document_id}")
+
+        except Exception as e:
+            msg = f"[DOC POLL FAIL] {file_path.name}: {str(e)}"
+            log.error(msg, exc_info=True)
+            raise RuntimeError(msg) from e
+
+        return document_id
+
+    def _standardize_batch(batch: List[Tuple[Path, str]]) -> List[str]:
+        """Request standardization of a batch of completed docs; returns one standardizationId per doc."""
+        # --- (C) Standardize a batch of docs with schema_id ---
+        document_ids = [document_id for _, document_id in batch]
+        try:
+            log.info(f"[STANDARDIZE START] {len(batch)} docs, docIds={document_ids}, schema={schema_id}")
 
-            for attempt_i in range(100):
-                if (time.time() - start_time) > POLL_TIMEOUT:
-                    raise RuntimeError(f"Timeout after {POLL_TIMEOUT}s: doc {document_id} never completed.")
+            std_url = "https://app.docupipe.ai/v2/standardize/batch"
+            std_payload = {
+                "documentIds": document_ids,
+                "schemaId": schema_id
+            }
+            std_resp = request_with_retries(
+                "POST",
+                std_url,
+                data=orjson.dumps(std_payload),
+                headers=headers,
+                request_timeout=REQUEST_TIMEOUT,
+                log=log
+            )
+            standardization_ids = orjson.loads(std_resp.content).get('standardizationIds', [])
+            if len(standardization_ids) != len(document_ids):
+                raise RuntimeError(f"Expected {len(document_ids)} standardizationIds, "
+                                   f"got {len(standardization_ids)}.")
 
-                time.sleep(POLL_INTERVAL)
+        except Exception as e:
+            msg = f"[STANDARDIZE FAIL] docIds={document_ids}: {str(e)}"
+            log.error(msg, exc_info=True)
+            raise RuntimeError(msg) from e
 
-                # Use our retry wrapper for GET
-                get_resp = request_with_retries(
-                    "GET",
-                    doc_get_url,
-                    headers=headers,
-                    request_timeout=REQUEST_TIMEOUT,
-                    log=log
-                )
-                status = get_resp.json().get('status')
+        return standardization_ids
 
-                if status == 'completed':
-                    log.info(f"[DOC COMPLETED] {file_path.name}, docId={document_id}")
-                    break
-                elif status == 'failed':
-                    raise RuntimeError(f"Doc {document_id} failed during processing.")
+    def _wait_for_standardization(file_path: Path, document_id: str, std_id: str):
+        """Poll a standardization until it exists."""
+        # --- (D) Poll for standardization to be "completed" within 900 seconds ---
+        try:
+            def _std_is_done(std_get_resp) -> bool:
+                # If the resource doesn't exist yet, keep polling
+                if std_get_resp.status_code == 404:
+                    return False
+                # Done on any other success code
+                std_get_resp.raise_for_status()
+                return True
+
+            _poll_until(
+                f"https://app.docupipe.ai/standardization/{std_id}",
+                headers,
+                _std_is_done,
+                description=f"standardization {std_id}",
+                log=log,
+                statuses_to_return={404}
+            )
+            log.info(f"[STANDARDIZE COMPLETE] docId={document_id}, stdId={std_id}")
 
         except Exception as e:
-            msg = f"[DOC POLL FAIL] {file_path.name}: {str(e)}"
+            msg = f"[STANDARDIZE FAIL] {file_path.name}, docId={document_id}: {str(e)}"
             log.error(msg, exc_info=True)
             raise RuntimeError(msg) from e
 
-        # --- (C) Optionally standardize if schema_id was provided ---
-        if schema_id:
-            try:
-                log.info(f"[STANDARDIZE START] {file_path.name}, docId={document_id}, schema={schema_id}")
-
-                std_url = "https://app.docupipe.ai/v2/standardize/batch"
-                std_payload = {
-                    "documentIds": [document_id],
-                    "schemaId": schema_id
-                }
-                std_resp = request_with_retries(
-                    "POST",
-                    std_url,
-                    json=std_payload,
-                    headers=headers,
-                    request_timeout=REQUEST_TIMEOUT,
-                    log=log
-                )
-                standardization_ids = std_resp.json().get('standardizationIds', [])
-                if not standardization_ids:
-                    raise RuntimeError(f"No standardizationId returned for doc {document_id}.")
-                std_id = standardization_ids[0]
-
-                # (D) Poll for standardization to be "completed" within 900 seconds
-                std_get_url = f"https://app.docupipe.ai/standardization/{std_id}"
-                start_time = time.time()
-
-                for attempt_i in range(100):
-                    if (time.time() - start_time) > POLL_TIMEOUT:
-                        raise RuntimeError(
-                            f"Timeout after {POLL_TIMEOUT}s: standardization {std_id} never completed."
-                        )
-
-                    time.sleep(POLL_INTERVAL)
-                    # Use our retry wrapper for GET
-                    std_get_resp = request_with_retries(
-                        "GET",
-                        std_get_url,
-                        headers=headers,
-                        request_timeout=REQUEST_TIMEOUT,
-                        log=log
-                    )
-                    # If the resource doesn't exist yet, keep polling
-                    if std_get_resp.status_code == 404:
-                        continue
-
-                    # Break on any other success code
-                    std_get_resp.raise_for_status()
-                    log.info(f"[STANDARDIZE COMPLETE] docId={document_id}, stdId={std_id}")
-                    break
-
-            except Exception as e:
-                msg = f"[STANDARDIZE FAIL] {file_path.name}, docId={document_id}: {str(e)}"
-                log.error(msg, exc_info=True)
-                raise RuntimeError(msg) from e
-
-        return True  # Return success to the caller
-
-    # 3) Run all files in parallel
-    log.info(f"Beginning parallel processing of {total_files} files. max_workers={max_workers}")
+    # 3) Run all files in parallel as a pipeline of stages, each on its own pool:
+    #    upload (max_workers) -> doc poll -> standardize -> standardization poll.
+    #    A stage never waits behind another stage's work, so slow polls can't hold up
+    #    uploads and batch requests don't queue behind sleeping polls. Docs that
+    #    need standardizing are collected into batches of up to STANDARDIZE_BATCH_SIZE,
+    #    flushed once full or after lingering STANDARDIZE_BATCH_LINGER seconds.
+    log.info(f"Beginning parallel processing of {total_files} files. max_workers={max_workers}, "
+             f"doc_poll_workers={DOC_POLL_WORKERS}, standardize_workers={STANDARDIZE_WORKERS}, "
+             f"std_poll_workers={STD_POLL_WORKERS}")
 
     files_completed = 0
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_file = {
-            executor.submit(_upload_and_standardize_file, f): f for f in allowed_files
-        }
 
-        for future in as_completed(future_to_file):
-            file_path = future_to_file[future]
-            try:
-                future.result()  # Raises if any error occurred
-                files_completed += 1
+    def _report_error(file_path: Path, error: Exception):
+        # Already logged, but let UI know if possible
+        if error_callback:
+            error_callback(file_path, str(error))
+        else:
+            log.error(f"[FILE ERROR] {file_path.name}: {error}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as upload_executor, \
+            ThreadPoolExecutor(max_workers=DOC_POLL_WORKERS) as doc_poll_executor, \
+            ThreadPoolExecutor(max_workers=STANDARDIZE_WORKERS) as standardize_executor, \
+            ThreadPoolExecutor(max_workers=STD_POLL_WORKERS) as std_poll_executor:
+        # Maps each in-flight future to (stage, item). item is a file path, except
+        # for _STAGE_STANDARDIZE where it is the list of (file_path, document_id).
+        pending = {}
+        # Uploads and doc polls still in flight; these may add docs to std_batch.
+        feeding = 0
+        files_to_upload = iter_allowed_files(folder_path, recursive=False)
+
+        def _submit_next_upload():
+            nonlocal feeding
+            file_path = next(files_to_upload, None)
+            if file_path is not None:
+                pending[upload_executor.submit(_upload_file, file_path)] = (_STAGE_UPLOAD, file_path)
+                feeding += 1
+
+        # Keep a bounded window of uploads queued so the pool never idles, topping it
+        # up as each upload finishes.
+        for _ in range(max_workers * UPLOAD_QUEUE_FACTOR):
+            _submit_next_upload()
+        std_batch = []
+        batch_deadline = 0.0
+
+        def _flush_std_batch():
+            nonlocal std_batch
+            pending[standardize_executor.submit(_standardize_batch, std_batch)] = (_STAGE_STANDARDIZE, std_batch)
+            std_batch = []
+
+        while pending or std_batch:
+            if std_batch and (feeding == 0 or time.time() >= batch_deadline):
+                _flush_std_batch()
+                continue
+
+            timeout = max(0.0, batch_deadline - time.time()) if std_batch else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, item = pending.pop(future)
+                if stage in (_STAGE_UPLOAD, _STAGE_DOC_POLL):
+                    feeding -= 1
+                if stage == _STAGE_UPLOAD:
+                    _submit_next_upload()
+                try:
+                    result = future.result()  # Raises if any error occurred
+                except Exception as e:
+                    failed_files = [f for f, _ in item] if stage == _STAGE_STANDARDIZE else [item]
+                    for file_path in failed_files:
+                        _report_error(file_path, e)
+                    continue
+
+                if stage == _STAGE_UPLOAD:
+                    pending[doc_poll_executor.submit(_wait_for_document, item, result)] = (_STAGE_DOC_POLL, item)
+                    feeding += 1
+                    continue
+
+                if stage == _STAGE_DOC_POLL and schema_id:
+                    if not std_batch:
+                        batch_deadline = time.time() + STANDARDIZE_BATCH_LINGER
+                    std_batch.append((item, result))
+                    # Flush here, not only at the top of the loop: one wait() can
+                    # return many finished polls, which would overfill the batch.
+                    if len(std_batch) == STANDARDIZE_BATCH_SIZE:
+                        _flush_std_batch()
+                    continue
+
+                if stage == _STAGE_STANDARDIZE:
+                    for (file_path, document_id), std_id in zip(item, result):
+                        std_future = std_poll_executor.submit(_wait_for_standardization, file_path, document_id, std_id)
+                        pending[std_future] = (_STAGE_STD_POLL, file_path)
+                    continue
 
-                log.info(f"[FILE DONE] {file_path.name} ({files_completed}/{total_files})")
+                files_completed += 1
+                log.info(f"[FILE DONE] {item.name} ({files_completed}/{total_files})")
                 if progress_callback:
                     progress_callback(files_completed, total_files)
 
-            except Exception as e:
-                # Already logged, but let UI know if possible
-                if error_callback:
-                    error_callback(file_path, str(e))
-                else:
-                    log.error(f"[FILE ERROR] {file_path.name}: {e}")
-
     log.info(f"All tasks completed. Processed={files_completed}, Skipped={total_files - files_completed}.")
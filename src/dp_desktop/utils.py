@@ -1,16 +1,223 @@
 import logging
+import os
+import random
+import socket
+import threading
 import time
-from typing import Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from dp_desktop.const import Params
 
+# Ceiling for default worker pools: well above what I/O-bound HTTP needs to keep
+# the link busy, but low enough to avoid contention past the API's rate limits.
+MAX_WORKERS_CEILING = 64
 
-def get_files(folder_path):
-    all_files = list(folder_path.rglob('*.*'))
-    files = [f for f in all_files if f.suffix.lower() in Params.allowed_suffix]
-    return all_files, files
+# Connection pool sizing for the shared session. pool_maxsize covers every thread
+# that can talk to one host at once, so each gets a reused keep-alive connection.
+# The widest case is upload_files: MAX_WORKERS_CEILING uploads plus upload.py's
+# DOC_POLL_WORKERS + STANDARDIZE_WORKERS + STD_POLL_WORKERS (100 + 4 + 100).
+# Keep the two in step.
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = MAX_WORKERS_CEILING + 100 + 4 + 100
+
+# The pool does not block: a thread that finds every pooled connection busy opens an
+# extra one (discarded afterwards) rather than waiting, since requests gives no way to
+# bound that wait. Sizing POOL_MAXSIZE to the worker pools keeps this rare, so TLS
+# handshakes to a host are still paid about POOL_MAXSIZE times and then reused.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=POOL_CONNECTIONS,
+    pool_maxsize=POOL_MAXSIZE,
+    max_retries=0,
+))
+API_HOST = "app.docupipe.ai"
+
+# Per-host AIMD pacing (see _HostThrottle)
+THROTTLE_STATUSES = {429, 503}  # Responses that mean "slow down"
+THROTTLE_MIN_INTERVAL = 0.01  # Seconds between requests below which a host is left unthrottled
+THROTTLE_MAX_INTERVAL = 5.0  # Slowest pacing: one request per this many seconds
+THROTTLE_RECOVERY_WINDOW = 20  # Successes needed before speeding a throttled host up again
+THROTTLE_RATE_STEP = 1.0  # Requests/second added to a throttled host's rate per recovery window
+THROTTLE_MAX_RETRY_AFTER = 12 * THROTTLE_MAX_INTERVAL  # Longest Retry-After pause honoured; longer ones are clamped
+
+
+class _HostThrottle:
+    """
+    Request pacing shared by every thread talking to one host.
+
+    Unthrottled until the host answers 429/503. Each such answer halves the allowed
+    request rate (multiplicative decrease) and honours Retry-After, up to
+    THROTTLE_MAX_RETRY_AFTER seconds; each run of THROTTLE_RECOVERY_WINDOW
+    successes adds THROTTLE_RATE_STEP requests/second back (additive increase)
+    until the host is unthrottled again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._interval = 0.0  # Seconds between request starts; 0 means unthrottled
+        self._next_slot = 0.0  # time.monotonic() at which the next request may start
+        self._successes = 0
+
+    def acquire(self):
+        """Block until this thread may send its next request to the host."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+    def on_throttled(self, retry_after: Optional[float]):
+        with self._lock:
+            self._interval = min(max(self._interval * 2, THROTTLE_MIN_INTERVAL * 2), THROTTLE_MAX_INTERVAL)
+            self._successes = 0
+            if retry_after:
+                # Clamped so one bogus header (e.g. a day, or a far-future date) can't stall the host
+                pause = min(retry_after, THROTTLE_MAX_RETRY_AFTER)
+                self._next_slot = max(self._next_slot, time.monotonic() + pause)
+
+    def on_success(self):
+        with self._lock:
+            if not self._interval:
+                return
+            self._successes += 1
+            if self._successes < THROTTLE_RECOVERY_WINDOW:
+                return
+            self._successes = 0
+            self._interval = 1 / (1 / self._interval + THROTTLE_RATE_STEP)
+            if self._interval < THROTTLE_MIN_INTERVAL:
+                self._interval = 0.0
+
+
+_THROTTLES: Dict[str, _HostThrottle] = {}
+_THROTTLES_LOCK = threading.Lock()
+
+
+def _throttle_for(url: str) -> _HostThrottle:
+    host = urlsplit(url).netloc
+    with _THROTTLES_LOCK:
+        if host not in _THROTTLES:
+            _THROTTLES[host] = _HostThrottle()
+        return _THROTTLES[host]
+
+
+def _parse_retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP-date), if any."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def warm_dns(host: str = API_HOST):
+    """
+    Resolve host on a background thread so the answer is already in the OS resolver
+    cache (DNS Client on Windows, mDNSResponder on macOS) by the time the connection
+    pool opens its first burst of sockets. Best effort; failures are ignored.
+    """
+    def resolve():
+        try:
+            socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+        except OSError as e:
+            logging.getLogger(__name__).debug(f"DNS warm-up for {host} failed: {e}")
+
+    threading.Thread(target=resolve, name="dns-warmup", daemon=True).start()
+
+
+def _scan_files(folder_path: Path, recursive: bool = True) -> Iterator[os.DirEntry]:
+    """
+    Lazily yield a DirEntry for every file in folder_path, and in its
+    subfolders if recursive.
+
+    os.scandir gets file types from the directory listing itself, so unlike
+    rglob + is_file there is no extra stat per entry on most platforms. Like
+    rglob, symlinked directories are not descended into and unreadable
+    directories are skipped.
+    """
+    stack = [os.fspath(folder_path)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Skipping unreadable directory: {e}")
+
+
+def _lower_suffix(name: str) -> str:
+    """Path(name).suffix.lower() without building a Path: '' for dotfiles and names without a dot."""
+    dot = name.rfind('.')
+    return name[dot:].lower() if 0 < dot < len(name) - 1 else ''
+
+
+def iter_files(folder_path: Path, recursive: bool = True) -> Iterator[Path]:
+    """Lazily yield every file in folder_path (and its subfolders if recursive)."""
+    return (Path(entry.path) for entry in _scan_files(folder_path, recursive))
+
+
+def iter_allowed_files(
+        folder_path: Path,
+        suffixes: Iterable[str] = Params.allowed_suffix,
+        recursive: bool = True
+) -> Iterator[Path]:
+    """Lazily yield files in folder_path (and its subfolders if recursive) whose extension is in suffixes."""
+    return (Path(entry.path) for entry in _scan_files(folder_path, recursive)
+            if _lower_suffix(entry.name) in suffixes)
+
+
+def count_files(folder_path: Path, recursive: bool = True) -> Tuple[int, int]:
+    """Return (all files, files with an allowed extension) in folder_path without building a list."""
+    total = allowed = 0
+    for entry in _scan_files(folder_path, recursive):
+        total += 1
+        if _lower_suffix(entry.name) in Params.allowed_suffix:
+            allowed += 1
+    return total, allowed
+
+
+def default_max_workers() -> int:
+    """Default thread count for I/O-bound HTTP fan-out: 8 per CPU, capped at MAX_WORKERS_CEILING."""
+    return min(MAX_WORKERS_CEILING, (os.cpu_count() or 4) * 8)
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session so every request reuses pooled keep-alive connections."""
+    return _SESSION
+
+
+def _backoff_schedule(max_retries: int, backoff_factor: int, max_backoff: int, circuit_breaker_limit: int):
+    """
+    Base sleep before each retry: exponential, capped at max_backoff, and truncated so
+    the total never exceeds circuit_breaker_limit. Its length is the number of retries
+    that will actually be attempted.
+    """
+    sleeps = []
+    total = 0
+    for i in range(max_retries - 1):
+        sleep_time = min(backoff_factor * (2 ** i), max_backoff)
+        if total + sleep_time > circuit_breaker_limit:
+            break
+        sleeps.append(sleep_time)
+        total += sleep_time
+    return sleeps
 
 
 def request_with_retries(
@@ -21,51 +228,79 @@ def request_with_retries(
         max_backoff: int = 600,
         request_timeout: int = 40,
         statuses_to_retry: Optional[set] = None,
+        statuses_to_return: Optional[set] = None,
         log: Optional[logging.Logger] = None,
         **kwargs
 ):
+    """
+    Send a request on the shared session, retrying connection errors and
+    statuses_to_retry with jittered exponential backoff. Requests are paced
+    per host: 429/503 responses slow down every thread talking to that host.
+
+    Any other error status fails immediately with HTTPError, unless it is in
+    statuses_to_return, in which case the response is returned to the caller
+    (e.g. a 404 while polling for a resource that doesn't exist yet).
+    """
     if statuses_to_retry is None:
         statuses_to_retry = {408, 429, 500, 502, 503, 504}
+    if statuses_to_return is None:
+        statuses_to_return = set()
 
     logger = log if log else logging.getLogger(__name__)
 
-    attempt = 0
-    total_sleep_time = 0
     circuit_breaker_limit = max_backoff * 2
+    sleeps = _backoff_schedule(max_retries, backoff_factor, max_backoff, circuit_breaker_limit)
+    total_attempts = len(sleeps) + 1
 
-    while attempt < max_retries:
-        attempt += 1
-        try:
-            response = requests.request(method, url, **kwargs, timeout=request_timeout)
-            if response.status_code in statuses_to_retry:
-                logger.warning(f"Request {method} {url} attempt={attempt} failed with "
-                               f"status={response.status_code}. Will retry...")
-                if attempt < max_retries:
-                    sleep_time = min(backoff_factor * (2 ** (attempt - 1)), max_backoff)
-                    if total_sleep_time + sleep_time > circuit_breaker_limit:
-                        logger.error(f"Circuit breaker triggered: total sleep time {total_sleep_time + sleep_time} "
-                                     f"would exceed limit of {circuit_breaker_limit} seconds.")
-                        response.raise_for_status()
-                    time.sleep(sleep_time)
-                    total_sleep_time += sleep_time
-                else:
-                    logger.error(f"Exhausted retries for {method} {url}. Failing permanently.")
-                    response.raise_for_status()
-            else:
-                response.raise_for_status()
-                return response
+    def fail_permanently(reason: str):
+        if total_attempts < max_retries:
+            logger.error(f"Circuit breaker triggered for {method} {url} after {total_attempts} attempts: "
+                         f"more retries would exceed {circuit_breaker_limit} seconds of sleep. {reason}")
+        else:
+            logger.error(f"Exhausted retries for {method} {url}. {reason}")
 
+    def sleep_before_retry(attempt: int):
+        # Full jitter so threads that failed together don't retry in lockstep
+        time.sleep(sleeps[attempt - 1] * random.uniform(0.5, 1.5))
+
+    throttle = _throttle_for(url)
+
+    for attempt in range(1, total_attempts + 1):
+        body = kwargs.get('data')
+        if hasattr(body, 'seek'):
+            # A streamed body was consumed by the previous attempt; rewind before resending.
+            body.seek(0)
+        throttle.acquire()
+        try:
+            response = _SESSION.request(method, url, **kwargs, timeout=request_timeout)
         except (requests.exceptions.RequestException, ConnectionError, TimeoutError) as exc:
-            logger.warning(f"Request {method} {url} attempt={attempt} threw exception: {exc}. Will retry...")
-            if attempt == max_retries:
-                logger.error(f"Exhausted retries for {method} {url}, last error: {exc}. Failing permanently.")
+            if attempt == total_attempts:
+                fail_permanently(f"Last error: {exc}. Failing permanently.")
                 raise
-            sleep_time = min(backoff_factor * (2 ** (attempt - 1)), max_backoff)
-            if total_sleep_time + sleep_time > circuit_breaker_limit:
-                logger.error(f"Circuit breaker triggered: total sleep time {total_sleep_time + sleep_time} "
-                             f"would exceed limit of {circuit_breaker_limit} seconds.")
-                raise Exception(f"Circuit breaker limit exceeded for {method} {url}") from exc
-            time.sleep(sleep_time)
-            total_sleep_time += sleep_time
-
-    raise RuntimeError(f"Request {method} {url} failed after {max_retries} retries with unknown cause.")
+            logger.warning(f"Request {method} {url} attempt={attempt} threw exception: {exc}. Will retry...")
+            sleep_before_retry(attempt)
+            continue
+
+        if response.status_code in THROTTLE_STATUSES:
+            throttle.on_throttled(_parse_retry_after(response))
+        else:
+            throttle.on_success()
+
+        if response.status_code in statuses_to_retry:
+            if attempt == total_attempts:
+                fail_permanently(f"Last status={response.status_code}. Failing permanently.")
+                response.close()  # Return the connection to the pool (matters for stream=True)
+                response.raise_for_status()
+            logger.warning(f"Request {method} {url} attempt={attempt} failed with "
+                           f"status={response.status_code}. Will retry...")
+            # Release the connection back to the pool (matters for stream=True).
+            response.close()
+            sleep_before_retry(attempt)
+            continue
+
+        if response.status_code not in statuses_to_return:
+            # Non-retryable error statuses (400, 401, 403, 404, 422, ...) fail fast
+            if response.status_code >= 400:
+                response.close()  # Return the connection to the pool (matters for stream=True)
+            response.raise_for_status()
+        return response
@@ -1,20 +1,35 @@
+import atexit
+import functools
+import hashlib
 import json
 import logging
 import os
 import platform
+import queue
 import sys
 import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import flet as ft
 
-from dp_desktop.download import download_dataset
-from dp_desktop.list_objects import list_schemas, list_dataset_names
-from dp_desktop.upload import upload_files
-from dp_desktop.utils import get_files
+# dp_desktop (and with it requests/urllib3/orjson) is imported where first used, so the
+# window paints without waiting on the HTTP stack.
 
 APP_NAME = "DocuPipe"
+LOG_MAX_BYTES = 10_000_000  # Size at which this run's log file is rotated
+LOG_BACKUP_COUNT = 3  # Rotated log files kept per run
+LOG_BUFFER_RECORDS = 200  # Records buffered before a file write; an ERROR or worse writes immediately
+UI_FLUSH_INTERVAL = 0.1  # Minimum seconds between page.update() calls driven by progress callbacks
+PROGRESS_MAX_LINES = 500  # Lines of progress/error text kept on screen; older lines scroll off
+LIST_CACHE_TTL = 60  # Seconds fetched dataset names and schemas are reused across dialog opens
+LIST_DISK_CACHE_MAX_AGE = 24 * 3600  # Seconds lists saved by a previous run are still shown while refetching
+CONFIG_SAVE_DELAY = 0.3  # Seconds repeated API key saves are coalesced into one config write
 
 
 ###############################################################################
@@ -41,17 +56,43 @@ LOGS_DIR.mkdir(parents=True, exist_ok=True)
 # Generate a new logfile name each run
 timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
 log_file = LOGS_DIR / f"{APP_NAME.lower()}_{timestamp_str}.log"
+LOG_FILE_STR = str(log_file)
+LOG_FILE_URL = log_file.as_uri()  # Properly escaped, unlike f"file://{log_file}" (spaces, Windows drive letters)
+# Progress lines added after each upload/download error
+ERROR_SUFFIX_LINES = (
+    f"Check logs here: {LOG_FILE_STR}",
+    "Please share logs with DocuPanda support if needed.",
+)
 
-# Configure logging to both file and console
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(message)s",
+# Configure logging to both file and console. Records are handed to a queue and
+# written by a listener thread, so logging never blocks the UI or upload/download
+# workers on disk I/O or on each other's handler locks.
+_log_formatter = logging.Formatter(
+    "%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[
-        logging.FileHandler(log_file, mode='w', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout),
-    ],
 )
+# The log file is size-capped so a long upload can't fill the disk, and records reach
+# it in batches. Errors flush the batch at once, so the file is current whenever the
+# app points the user at it.
+_file_handler = RotatingFileHandler(
+    log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+)
+_stream_handler = logging.StreamHandler(sys.stdout)
+for _handler in (_file_handler, _stream_handler):
+    _handler.setFormatter(_log_formatter)
+_buffered_file_handler = MemoryHandler(LOG_BUFFER_RECORDS, flushLevel=logging.ERROR, target=_file_handler)
+# atexit runs handlers last-registered first: stop the listener (draining the queue),
+# then flush and close the buffer.
+atexit.register(_buffered_file_handler.close)
+atexit.register(_buffered_file_handler.flush)
+
+_log_queue = queue.Queue(-1)
+# The QueueHandler only renders the message (and any traceback); the listener's
+# handlers add the timestamp/level prefix.
+logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[QueueHandler(_log_queue)])
+_log_listener = QueueListener(_log_queue, _buffered_file_handler, _stream_handler, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # Drains queued records before the handlers close
 
 
 # Ensure uncaught exceptions get logged at CRITICAL level
@@ -67,15 +108,31 @@ sys.excepthook = handle_exception
 
 # Optionally, redirect all print statements to logging as well
 class PrintToLogger(object):
+    """
+    Stream that logs each complete line written to it. print() calls write()
+    separately for its arguments, separators and the newline, so text is buffered
+    per thread until a newline arrives and a print becomes one log record.
+    """
+
     def __init__(self, level=logging.INFO):
         self._level = level
+        self._local = threading.local()
 
     def write(self, message):
-        if message.strip():
-            logging.log(self._level, message.strip())
+        buffered = getattr(self._local, "buffer", "") + message
+        if "\n" in buffered:
+            *lines, buffered = buffered.split("\n")
+            for line in lines:
+                if line.strip():
+                    logging.log(self._level, line.strip())
+        self._local.buffer = buffered
+        return len(message)
 
     def flush(self):
-        pass
+        buffered = getattr(self._local, "buffer", "")
+        self._local.buffer = ""
+        if buffered.strip():
+            logging.log(self._level, buffered.strip())
 
 
 sys.stdout = PrintToLogger(logging.INFO)
@@ -87,24 +144,76 @@ sys.stderr = PrintToLogger(logging.ERROR)
 
 CONFIG_FILE = CONFIG_DIR / "config.json"
 
+# In-memory copy of the saved API key; None until first read from CONFIG_FILE
+_API_KEY_CACHE: Optional[str] = None
+_API_KEY_LOCK = threading.Lock()
+# Pending debounced write of the API key to CONFIG_FILE (see save_api_key)
+_config_save_timer: Optional[threading.Timer] = None
+_CONFIG_WRITE_LOCK = threading.Lock()
+
+
+def _read_api_key_file():
+    """Read the API key from our standard config file."""
+    try:
+        # One read and a parse from bytes, rather than json.load over a text stream
+        return json.loads(CONFIG_FILE.read_bytes()).get("api_key", "")
+    except FileNotFoundError:
+        return ""
+    except (OSError, ValueError, AttributeError) as e:  # Unreadable, not JSON, or not a JSON object
+        print("Error loading config:", e)  # Goes to logs
+        return ""
+
 
 def load_api_key():
-    """Load the API key from our standard config file."""
-    if CONFIG_FILE.exists():
-        try:
-            with open(CONFIG_FILE, "r") as f:
-                config = json.load(f)
-                return config.get("api_key", "")
-        except Exception as e:
-            print("Error loading config:", e)  # Goes to logs
-    return ""
+    """Load the API key, reading the config file only on first use."""
+    global _API_KEY_CACHE
+    with _API_KEY_LOCK:
+        if _API_KEY_CACHE is None:
+            _API_KEY_CACHE = _read_api_key_file()
+        return _API_KEY_CACHE
 
 
 def save_api_key(api_key):
-    """Save the API key to our standard config file."""
-    config = {"api_key": api_key}
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f)
+    """
+    Save the API key to the in-memory cache right away and to our standard config
+    file shortly after, off the calling thread. Saves within CONFIG_SAVE_DELAY
+    seconds of each other are written once.
+    """
+    global _API_KEY_CACHE, _config_save_timer
+    with _API_KEY_LOCK:
+        _API_KEY_CACHE = api_key
+        if _config_save_timer is None:
+            _config_save_timer = threading.Timer(CONFIG_SAVE_DELAY, lambda: run_in_background(_write_api_key_file))
+            _config_save_timer.daemon = True
+            _config_save_timer.start()
+    invalidate_list_cache()  # Lists fetched with the previous key no longer apply
+
+
+def _write_api_key_file():
+    """Write the cached API key to CONFIG_FILE via a temp file and rename, so a crash never leaves it truncated."""
+    global _config_save_timer
+    with _API_KEY_LOCK:
+        _config_save_timer = None
+        config = {"api_key": _API_KEY_CACHE}
+    tmp_file = CONFIG_FILE.with_suffix(".json.tmp")
+    try:
+        with _CONFIG_WRITE_LOCK:
+            tmp_file.write_text(json.dumps(config))
+            os.replace(tmp_file, CONFIG_FILE)
+    except OSError as e:
+        logging.error(f"Error saving config: {e}")
+
+
+def _flush_pending_api_key():
+    """Write a save still waiting on its timer before the process exits."""
+    with _API_KEY_LOCK:
+        timer = _config_save_timer
+    if timer is not None:
+        timer.cancel()
+        _write_api_key_file()
+
+
+atexit.register(_flush_pending_api_key)
 
 
 def get_latest_api_key():
@@ -112,6 +221,183 @@ def get_latest_api_key():
     return key.strip() if key else ""
 
 
+# Shared, bounded pool for short background work started from the UI (list fetches,
+# which have a request timeout, and config writes). Uploads, downloads and folder
+# scans keep their own daemon threads: they can run for minutes, would starve this
+# pool, and must not keep the process alive after the window closes, which pool
+# workers (joined at exit) would.
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dp-bg")
+
+
+def _log_task_exception(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.error("Background task failed", exc_info=future.exception())
+
+
+def run_in_background(fn: Callable, *args) -> Future:
+    """Run fn(*args) on the shared pool, logging any exception it raises."""
+    future = _EXECUTOR.submit(fn, *args)
+    future.add_done_callback(_log_task_exception)
+    return future
+
+# Dataset-name and schema lists, keyed by (kind, api_key) -> (fetched_at, future).
+# Storing the future lets concurrent dialog opens share one in-flight request.
+_LIST_CACHE: Dict[Tuple[str, str], Tuple[float, Future]] = {}
+_LIST_CACHE_LOCK = threading.Lock()
+
+
+def _cached_fetch(kind: str, fetch: Callable[[str], Any], api_key: str, ttl: float = LIST_CACHE_TTL) -> Future:
+    """Return a future for fetch(api_key), reusing one started less than ttl seconds ago unless it failed."""
+    with _LIST_CACHE_LOCK:
+        entry = _LIST_CACHE.get((kind, api_key))
+        if entry is not None:
+            fetched_at, future = entry
+            failed = future.done() and future.exception() is not None
+            if not failed and time.monotonic() - fetched_at < ttl:
+                return future
+        future = run_in_background(fetch, api_key)
+        future.add_done_callback(lambda f: _persist_list(kind, api_key, f))
+        _LIST_CACHE[(kind, api_key)] = (time.monotonic(), future)
+        return future
+
+
+# Lists from the last run, saved next to CONFIG_FILE so dialogs can show them
+# immediately after a cold start while the fresh fetch is in flight. Stored as
+# {"key": <API key fingerprint>, "datasets"/"schemas": {"ts": ..., "items": [...]}},
+# with schemas as [schemaId, schemaName] pairs.
+
+LIST_DISK_CACHE_FILE = CONFIG_DIR / "datasets_cache.json"
+_PERSISTED_LISTS_LOCK = threading.Lock()
+
+
+def _key_fingerprint(api_key: str) -> str:
+    """Identify which API key saved lists belong to without writing the key itself to disk."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _load_persisted_lists() -> dict:
+    try:
+        persisted = json.loads(LIST_DISK_CACHE_FILE.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable list cache {LIST_DISK_CACHE_FILE}: {e}")
+        return {}
+    return persisted if isinstance(persisted, dict) else {}
+
+
+_PERSISTED_LISTS = _load_persisted_lists()
+# Kinds fetched successfully during this run. Saved lists only stand in for a cold
+# start: once a kind has been fetched, showing the saved copy (which is then just
+# this run's previous result) would mask a refetch in progress.
+_LISTS_FETCHED_THIS_RUN = set()
+
+
+def _persisted_items(kind: str, api_key: str) -> Optional[list]:
+    with _PERSISTED_LISTS_LOCK:
+        if kind in _LISTS_FETCHED_THIS_RUN or _PERSISTED_LISTS.get("key") != _key_fingerprint(api_key):
+            return None
+        entry = _PERSISTED_LISTS.get(kind)
+    try:
+        if 0 <= time.time() - entry["ts"] < LIST_DISK_CACHE_MAX_AGE:
+            return entry["items"]
+    except (TypeError, KeyError):
+        pass
+    return None
+
+
+def persisted_dataset_names(api_key: str) -> Optional[Tuple[str, ...]]:
+    """Dataset names a previous run saved for this API key, or None if missing or expired."""
+    items = _persisted_items("datasets", api_key)
+    return tuple(items) if isinstance(items, list) else None
+
+
+def persisted_schemas(api_key: str) -> Optional[tuple]:
+    """Schemas a previous run saved for this API key, or None if missing or expired."""
+    from dp_desktop.list_objects import Schema
+
+    items = _persisted_items("schemas", api_key)
+    try:
+        return tuple(Schema(schemaId=schema_id, schemaName=name) for schema_id, name in items)
+    except (TypeError, ValueError):
+        return None
+
+
+def _persist_list(kind: str, api_key: str, future: Future):
+    """Record a successful fetch in _PERSISTED_LISTS and write it to disk in the background."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    value = future.result()
+    if kind == "schemas":
+        items = [[s.schemaId, s.schemaName] for s in value]
+    else:
+        items = list(value)
+
+    fingerprint = _key_fingerprint(api_key)
+    with _PERSISTED_LISTS_LOCK:
+        if _PERSISTED_LISTS.get("key") != fingerprint:
+            _PERSISTED_LISTS.clear()
+            _PERSISTED_LISTS["key"] = fingerprint
+        _PERSISTED_LISTS[kind] = {"ts": time.time(), "items": items}
+        _LISTS_FETCHED_THIS_RUN.add(kind)
+    run_in_background(_write_persisted_lists)
+
+
+def _write_persisted_lists():
+    """Write _PERSISTED_LISTS via a temp file and rename, like the API key config."""
+    tmp_file = LIST_DISK_CACHE_FILE.with_suffix(".json.tmp")
+    try:
+        with _CONFIG_WRITE_LOCK:
+            # Serialized inside the write lock, so whichever write runs last saves the newest lists
+            with _PERSISTED_LISTS_LOCK:
+                data = json.dumps(_PERSISTED_LISTS)
+            tmp_file.write_text(data)
+            os.replace(tmp_file, LIST_DISK_CACHE_FILE)
+    except OSError as e:
+        logging.warning(f"Could not write list cache {LIST_DISK_CACHE_FILE}: {e}")
+
+
+def render_list(
+        future: Future,
+        persisted: Optional[tuple],
+        render: Callable[[tuple], None],
+        on_error: Callable[[BaseException], None]
+):
+    """
+    Call render() with the list future resolves to, or on_error() with the exception
+    if the fetch failed (run_in_background has already logged it). If the fetch is
+    still running and a previous run saved the list, render that first so the dialog
+    is usable immediately; the fresh list replaces it when it arrives.
+    """
+    def done(f: Future):
+        if f.cancelled():
+            return
+        if f.exception() is not None:
+            on_error(f.exception())
+        else:
+            render(tuple(f.result()))
+
+    if not future.done() and persisted is not None:
+        render(persisted)
+    future.add_done_callback(done)
+
+
+def invalidate_list_cache():
+    """Forget fetched dataset names and schemas so the next dialog open fetches them again."""
+    with _LIST_CACHE_LOCK:
+        _LIST_CACHE.clear()
+
+
+def cached_dataset_names(api_key: str) -> Future:
+    from dp_desktop.list_objects import list_dataset_names
+    return _cached_fetch("datasets", list_dataset_names, api_key)
+
+
+def cached_schemas(api_key: str) -> Future:
+    from dp_desktop.list_objects import list_schemas
+    return _cached_fetch("schemas", list_schemas, api_key)
+
+
 def main(page: ft.Page):
     page.title = "DocuPanda"
     page.horizontal_alignment = ft.CrossAxisAlignment.STRETCH
@@ -130,6 +416,23 @@ def main(page: ft.Page):
     #  PROGRESS / STATUS TEXT, WRAPPED IN A SCROLLABLE CONTAINER
     # --------------------------------------------------------------------
     progress_text = ft.Text("", selectable=True)
+    # Lines shown in progress_text. Callbacks append here and the text is joined
+    # once per render instead of growing a string on every message.
+    progress_lines = deque(maxlen=PROGRESS_MAX_LINES)
+    progress_lock = threading.Lock()
+
+    def add_progress(*lines: str):
+        with progress_lock:
+            progress_lines.extend(lines)
+
+    def set_progress(line: str):
+        with progress_lock:
+            progress_lines.clear()
+            progress_lines.append(line)
+
+    def render_progress():
+        with progress_lock:
+            progress_text.value = "\n".join(progress_lines)
     progress_container = ft.Container(
         content=progress_text,
         width=600,
@@ -137,15 +440,17 @@ def main(page: ft.Page):
     )
 
     def clear_progress_text():
+        """Reset the progress area; the caller's next page.update() (or page.open()) sends it."""
+        with progress_lock:
+            progress_lines.clear()
         progress_text.value = ""
         logs_link.visible = False
-        page.update()
 
     # This link becomes visible only on error and opens the local log file
     logs_link = ft.TextButton(
         text="View log file",
         visible=False,
-        on_click=lambda e: page.launch_url(f"file://{log_file}")
+        on_click=lambda e: page.launch_url(LOG_FILE_URL)
     )
 
     # --------------------------------------------------------------------
@@ -164,45 +469,73 @@ def main(page: ft.Page):
         progress_bar.visible = False
         page.update()
 
+    # --------------------------------------------------------------------
+    #  Throttled UI updates for per-file callbacks from worker threads
+    # --------------------------------------------------------------------
+    ui_flush_lock = threading.Lock()
+    last_ui_flush = 0.0
+    ui_flush_timer = None
+
+    def flush_ui():
+        nonlocal last_ui_flush, ui_flush_timer
+        with ui_flush_lock:
+            ui_flush_timer = None
+            last_ui_flush = time.monotonic()
+        render_progress()
+        page.update()
+
+    def request_ui_update():
+        """
+        page.update() at most once per UI_FLUSH_INTERVAL. Calls inside the interval
+        schedule a single trailing update, so the latest state is always rendered.
+        """
+        nonlocal ui_flush_timer
+        with ui_flush_lock:
+            if ui_flush_timer is not None:
+                return  # A trailing update is already scheduled
+            wait = last_ui_flush + UI_FLUSH_INTERVAL - time.monotonic()
+            if wait > 0:
+                ui_flush_timer = threading.Timer(wait, flush_ui)
+                ui_flush_timer.daemon = True
+                ui_flush_timer.start()
+                return
+        flush_ui()
+
     # --------------------------------------------------------------------
     #  UPLOAD finishing/progress/error
     # --------------------------------------------------------------------
     def finish_upload():
-        progress_text.value += "\nUpload complete!"
+        add_progress("Upload complete!")
+        render_progress()
         hide_progress_ui()
-        page.update()
 
     def progress_callback_upload(files_processed, total_files):
         progress_bar.value = files_processed / total_files
-        progress_text.value = f"Uploading {files_processed} of {total_files} files..."
-        show_progress_ui()
-        page.update()
+        set_progress(f"Uploading {files_processed} of {total_files} files...")
+        request_ui_update()
 
     def handle_upload_error(file_path, error_msg):
-        progress_text.value += f"\nError uploading {file_path.name}: {error_msg}"
-        progress_text.value += f"\nCheck logs here: {log_file}\nPlease share logs with DocuPanda support if needed."
+        add_progress(f"Error uploading {file_path.name}: {error_msg}", *ERROR_SUFFIX_LINES)
         logs_link.visible = True
-        page.update()
+        request_ui_update()
 
     # --------------------------------------------------------------------
     #  DOWNLOAD finishing/progress/error
     # --------------------------------------------------------------------
     def finish_download():
-        progress_text.value += "\nDownload complete!"
+        add_progress("Download complete!")
+        render_progress()
         hide_progress_ui()
-        page.update()
 
     def progress_callback_download(files_processed, total_files):
         progress_bar.value = files_processed / total_files
-        progress_text.value = f"Downloading {files_processed} of {total_files} documents..."
-        show_progress_ui()
-        page.update()
+        set_progress(f"Downloading {files_processed} of {total_files} documents...")
+        request_ui_update()
 
     def handle_download_error(doc_id_or_path, error_msg):
-        progress_text.value += f"\nError downloading {doc_id_or_path}: {error_msg}"
-        progress_text.value += f"\nCheck logs here: {log_file}\nPlease share logs with DocuPanda support if needed."
+        add_progress(f"Error downloading {doc_id_or_path}: {error_msg}", *ERROR_SUFFIX_LINES)
         logs_link.visible = True
-        page.update()
+        request_ui_update()
 
     # --------------------------------------------------------------------
     #  config_view: For entering/saving the API key
@@ -271,6 +604,27 @@ def main(page: ft.Page):
         options=[],
         width=300,
     )
+    # Lists currently rendered into the controls above (and dataset_dropdown below).
+    # A fetch that returns the same list leaves the control untouched, so reopening a
+    # dialog doesn't rebuild every option and send it to the client again.
+    shown_dataset_names: Tuple[str, ...] = ()
+    shown_schemas: tuple = ()
+    shown_download_names: Tuple[str, ...] = ()
+
+    # Flet objects built from a fetched list, memoized on the list so switching back
+    # to a previous list doesn't construct them all again. Kept here rather than at
+    # module level because the Option controls belong to this page's dropdowns.
+    @functools.lru_cache(maxsize=8)
+    def build_dataset_suggestions(names: Tuple[str, ...]) -> list:
+        return [ft.AutoCompleteSuggestion(key=name, value=name) for name in names]
+
+    @functools.lru_cache(maxsize=8)
+    def build_dataset_options(names: Tuple[str, ...]) -> list:
+        return [ft.dropdown.Option(name, name) for name in names]
+
+    @functools.lru_cache(maxsize=8)
+    def build_schema_options(schemas: tuple) -> list:
+        return [ft.dropdown.Option(key=s.schemaId, text=s.schemaName) for s in schemas]
 
     def handle_cancel(dialog, e):
         page.close(dialog)
@@ -281,9 +635,11 @@ def main(page: ft.Page):
         page.close(dialog)
 
         def do_upload():
+            from dp_desktop.upload import upload_files
+
+            add_progress("Starting upload...")
+            render_progress()
             show_progress_ui()
-            progress_text.value += "\nStarting upload..."
-            page.update()
 
             upload_files(
                 folder_path,
@@ -295,15 +651,15 @@ def main(page: ft.Page):
             )
             finish_upload()
 
-        threading.Thread(target=do_upload, daemon=True).start()
+        threading.Thread(target=do_upload, name="dp-upload", daemon=True).start()
 
     def open_folder_dialog(folder_path, allowed_count, total_file_count):
+        # No page.update() here: page.open() below sends these changes with the dialog
         dataset_name_autocomplete.value = ""
         schema_dropdown.value = ""
-        schema_dropdown.options = []
         schema_dropdown.visible = False
-        page.update()
 
+        schemas_ring = ft.ProgressRing(visible=True)  # indicates we are fetching schemas
         dlg = ft.AlertDialog(
             modal=True,
             title=ft.Text("Upload Settings"),
@@ -317,12 +673,13 @@ def main(page: ft.Page):
                     ft.Divider(),
                     ft.Text("Optionally, standardize each document with a schema below:"),
                     schema_dropdown,
-                    ft.ProgressRing(visible=True),  # indicates we are fetching schemas
+                    schemas_ring,
                 ],
                 spacing=10,
             ),
             actions_alignment=ft.MainAxisAlignment.END,
             actions=[
+                ft.TextButton("Refresh lists", icon=ft.Icons.REFRESH, on_click=lambda e: refresh_lists()),
                 ft.TextButton("Cancel", on_click=lambda e: handle_cancel(dlg, e)),
                 ft.ElevatedButton(
                     "Confirm Upload",
@@ -330,49 +687,93 @@ def main(page: ft.Page):
                 ),
             ],
         )
-        # Fetch dataset names for autocomplete
-        def fetch_dataset_names():
-            latest_key = get_latest_api_key()
-            names = list_dataset_names(latest_key)
-            dataset_name_autocomplete.suggestions = [
-                ft.AutoCompleteSuggestion(key=name, value=name)
-                for name in names
-            ]
+        # Fill dataset names for autocomplete and the schema dropdown. Cached lists are
+        # rendered right away; otherwise this runs when the background fetch finishes.
+        def show_dataset_names(names: Tuple[str, ...]):
+            nonlocal shown_dataset_names
+            if names == shown_dataset_names:
+                return
+            shown_dataset_names = names
+            dataset_name_autocomplete.suggestions = build_dataset_suggestions(names)
             page.update()
 
-        def fetch_schemas():
-            latest_key = get_latest_api_key()
-            schemas_fetched = list_schemas(latest_key)
-            schema_dropdown.options = [
-                ft.dropdown.Option(key=s.schemaId, text=s.schemaName)
-                for s in schemas_fetched
-            ]
+        def show_schemas(schemas_fetched: tuple):
+            nonlocal shown_schemas
+            if schemas_fetched != shown_schemas:
+                shown_schemas = schemas_fetched
+                schema_dropdown.options = build_schema_options(schemas_fetched)
             schema_dropdown.visible = True
-            dlg.content.controls.pop()  # remove spinner
+            schemas_ring.visible = False
             page.update()
 
-        threading.Thread(target=fetch_schemas, daemon=True).start()
-        threading.Thread(target=fetch_dataset_names, daemon=True).start()
+        def schemas_failed(exc: BaseException):
+            # Keep whatever list is already shown (e.g. one saved by a previous run)
+            schema_dropdown.visible = bool(shown_schemas)
+            schemas_ring.visible = False
+            show_snackbar(f"Could not load schemas: {exc}")
+
+        def dataset_names_failed(exc: BaseException):
+            show_snackbar(f"Could not load dataset names: {exc}")
+
+        def load_lists(use_persisted: bool = True):
+            latest_key = get_latest_api_key()
+            saved_schemas = persisted_schemas(latest_key) if use_persisted else None
+            saved_names = persisted_dataset_names(latest_key) if use_persisted else None
+            render_list(cached_schemas(latest_key), saved_schemas, show_schemas, schemas_failed)
+            render_list(cached_dataset_names(latest_key), saved_names, show_dataset_names, dataset_names_failed)
+
+        def refresh_lists():
+            # Datasets or schemas may have changed on the server since they were cached;
+            # keep the spinner up until the fresh lists arrive.
+            invalidate_list_cache()
+            schemas_ring.visible = True
+            page.update()
+            load_lists(use_persisted=False)
+
         page.open(dlg)
+        load_lists()
 
     def pick_folder_result(e: ft.FilePickerResultEvent):
         if e.path:
+            folder_path = Path(e.path)
+
             # Clear previous logs only if starting a new upload
             clear_progress_text()
             dataset_name_autocomplete.value = ""
 
-            folder_path = Path(e.path)
-
-            all_files, allowed_files = get_files(folder_path)
-
-            open_folder_dialog(folder_path, len(allowed_files), len(all_files))
+            # Counting a large folder takes a while; do it off the UI thread and show
+            # a spinner in place of the upload button until the dialog can open.
+            upload_button.visible = False
+            folder_scan_ring.visible = True
+            page.update()
+            # A daemon thread rather than the shared pool: a slow scan (huge or network
+            # folder) must not keep the process alive after the window closes.
+            threading.Thread(target=scan_folder, args=(folder_path,), name="dp-scan", daemon=True).start()
         else:
             show_snackbar("No folder selected.")
 
+    def scan_folder(folder_path: Path):
+        from dp_desktop.utils import count_files
+
+        try:
+            # Same scope as upload_files: the folder itself, not its subfolders
+            total_file_count, allowed_count = count_files(folder_path, recursive=False)
+        except Exception:
+            upload_button.visible = True
+            folder_scan_ring.visible = False
+            page.update()
+            raise
+
+        # Opening the dialog sends these changes too
+        upload_button.visible = True
+        folder_scan_ring.visible = False
+        open_folder_dialog(folder_path, allowed_count, total_file_count)
+
     upload_button = ft.ElevatedButton(
         text="Upload Dataset",
         on_click=lambda e: file_picker.get_directory_path()
     )
+    folder_scan_ring = ft.ProgressRing(width=24, height=24, visible=False)
 
     # --------------------------------------------------------------------
     #  DOWNLOAD flow
@@ -409,9 +810,11 @@ def main(page: ft.Page):
         page.close(dialog)
 
         def do_download():
+            from dp_desktop.download import download_dataset
+
+            add_progress("Starting download...")
+            render_progress()
             show_progress_ui()
-            progress_text.value += "\nStarting download..."
-            page.update()
 
             download_dataset(
                 api_key=get_latest_api_key(),
@@ -422,15 +825,15 @@ def main(page: ft.Page):
             )
             finish_download()
 
-        threading.Thread(target=do_download, daemon=True).start()
+        threading.Thread(target=do_download, name="dp-download", daemon=True).start()
 
     def handle_download_cancel(dialog, e):
         page.close(dialog)
 
     def open_download_dialog(e):
+        # No page.update() for this setup: page.open() below sends it with the dialog
         clear_progress_text()
 
-        dataset_dropdown.options = []
         dataset_dropdown.value = ""
         folder_text_field.value = ""
         folder_text_field.visible = False
@@ -464,6 +867,7 @@ def main(page: ft.Page):
             content=dialog_column,
             actions_alignment=ft.MainAxisAlignment.END,
             actions=[
+                ft.TextButton("Refresh list", icon=ft.Icons.REFRESH, on_click=lambda ev: refresh_dataset_names()),
                 ft.TextButton("Cancel", on_click=lambda ev: handle_download_cancel(dlg, ev)),
                 ft.ElevatedButton("Confirm Download", on_click=lambda ev: handle_download_confirm(dlg, ev)),
             ],
@@ -471,14 +875,30 @@ def main(page: ft.Page):
 
         page.open(dlg)
 
-        def fetch_dataset_names():
-            names = list_dataset_names(get_latest_api_key())
-            dataset_dropdown.options = [ft.dropdown.Option(name, name) for name in names]
-            if loading_row in dialog_column.controls:
-                dialog_column.controls.remove(loading_row)
+        def show_dataset_names(names: Tuple[str, ...]):
+            nonlocal shown_download_names
+            if names != shown_download_names:
+                shown_download_names = names
+                dataset_dropdown.options = build_dataset_options(names)
+            loading_row.visible = False
+            page.update()
+
+        def dataset_names_failed(exc: BaseException):
+            loading_row.visible = False
+            show_snackbar(f"Could not load dataset names: {exc}")
+
+        def load_dataset_names(use_persisted: bool = True):
+            latest_key = get_latest_api_key()
+            saved_names = persisted_dataset_names(latest_key) if use_persisted else None
+            render_list(cached_dataset_names(latest_key), saved_names, show_dataset_names, dataset_names_failed)
+
+        def refresh_dataset_names():
+            invalidate_list_cache()
+            loading_row.visible = True
             page.update()
+            load_dataset_names(use_persisted=False)
 
-        threading.Thread(target=fetch_dataset_names, daemon=True).start()
+        load_dataset_names()
 
     download_button = ft.ElevatedButton(
         text="Download Dataset Results",
@@ -492,7 +912,7 @@ def main(page: ft.Page):
     #  MAIN LAYOUT
     # --------------------------------------------------------------------
     buttons_row = ft.Row(
-        controls=[upload_button, download_button],
+        controls=[upload_button, folder_scan_ring, download_button],
         spacing=20,
     )
 